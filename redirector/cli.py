@@ -1,7 +1,6 @@
 from argparse import ArgumentParser
 from functools import partial
 from redirector import __version__
-from redirector.core import Redirector
 
 import signal
 import sys
@@ -34,6 +33,9 @@ def main():
     parser.add_argument("-c", "--config", type=str, required=True, help="Path to the configuration file")
     cmdline_args = vars(parser.parse_args())
 
+    # Import the core only once the command line was parsed, so --help and --version stay fast
+    from redirector.core import Redirector
+
     # Initialise Redirector
     redirector = Redirector(cmdline_args["config"])
 
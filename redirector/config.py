@@ -2,9 +2,16 @@ from cerberus import Validator
 from redirector.healthchecks import healthchecks, schemas
 from redirector.strategies import strategies
 
+import copy
 import os
 import yaml
 
+# Use the libyaml based loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+
 
 _CORE_SCHEMA = {
     "log_level": {
@@ -75,6 +82,8 @@ _LOADBALANCER_SCHEMA = {
         "allowed": list(strategies.keys())
     },
     "healthcheck": {
+        "type": "dict",
+        "required": True,
         "schema": {
             "type": {
                 "type": "string",
@@ -86,6 +95,12 @@ _LOADBALANCER_SCHEMA = {
                 "required": True,
                 "min": 0
             },
+            "cache_ttl": {
+                "type": "float",
+                "required": False,
+                "min": 0,
+                "default": 0
+            },
             "config": {
                 "type": "dict",
                 "required": True
@@ -95,6 +110,26 @@ _LOADBALANCER_SCHEMA = {
 }
 
 
+def _build_lb_validators():
+    """Build the load balancer validators for each healthcheck type.
+
+    :returns: Dict with the validator for each healthcheck type
+    """
+
+    validators = {}
+    for hc_type, hc_schema in schemas.items():
+        schema = copy.deepcopy(_LOADBALANCER_SCHEMA)
+        schema["healthcheck"]["schema"]["config"]["schema"] = hc_schema
+        validators[hc_type] = Validator(schema, purge_unknown=True)
+
+    return validators
+
+
+_CORE_VALIDATOR = Validator(_CORE_SCHEMA, purge_unknown=True)
+_LB_VALIDATOR = Validator(_LOADBALANCER_SCHEMA, purge_unknown=True)
+_LB_VALIDATORS_BY_HC = _build_lb_validators()
+
+
 class ConfigError(Exception):
     pass
 
@@ -105,19 +140,28 @@ class ConfigLoader(object):
         self._config_file = config_file
         self._lb_configs_dir = None
 
-    def _validate_or_raise(self, schema, document, errdesc):
+        # Load balancer configuration files (name, path) and directory mtime when they were listed
+        self._lb_config_files = []
+        self._lb_configs_dir_mtime_ns = None
+
+        # Validated load balancer configs, by path: (mtime_ns, size, config)
+        self._parsed_cache = {}
+
+    def _validate_or_raise(self, validator, document, errdesc):
         """Validate a configuration of raise an error.
 
-        :schema: Schema to use for validation
+        :validator: Validator to use for validation
         :document: Document to validate agains the schema
         :errdesc: Base error description
-        :kwargs: Extra normalization rules
         :returns: Validated document
         :raises: ConfigError in case of error
         """
 
+        # Make sure the document is a mapping, the validator can't handle anything else
+        if not isinstance(document, dict):
+            raise ConfigError(f"{errdesc}: the configuration must be a mapping.")
+
         # Validate the configuration
-        validator = Validator(schema, purge_unknown=True)
         if not validator.validate(document):
 
             # Return the errors
@@ -138,12 +182,12 @@ class ConfigLoader(object):
         # Load the YAML configuration
         try:
             with open(self._config_file, "r") as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=_SafeLoader)
         except FileNotFoundError:
             raise ConfigError(f"The configuration file \"{self._config_file}\" doesn't exist.")
 
         # Validate the configuration file
-        config = self._validate_or_raise(_CORE_SCHEMA, config, "Failed to parse the configuration file")
+        config = self._validate_or_raise(_CORE_VALIDATOR, config, "Failed to parse the configuration file")
 
         # Identify the load balancers configuration directory
         self._lb_configs_dir = os.path.join(os.path.dirname(self._config_file), config["lb_configs_dir"])
@@ -158,29 +202,61 @@ class ConfigLoader(object):
         """
 
         # Make sure the load balancers configuration directory exists
-        if not os.path.exists(self._lb_configs_dir):
+        try:
+            dir_mtime_ns = os.stat(self._lb_configs_dir).st_mtime_ns
+        except FileNotFoundError:
             raise ConfigError(f"The load balancers configuration directory {self._lb_configs_dir} doesn't exist.")
+        except OSError as e:
+            raise ConfigError(f"Failed to access the load balancers configuration directory {self._lb_configs_dir}: {e}")
+
+        # Identify all load balancers configuration files ending with .yml or .yaml,
+        # unless no file was added, removed or renamed since they were last listed
+        if dir_mtime_ns != self._lb_configs_dir_mtime_ns:
 
-        # Identify all load balancers configuration files ending with .yml or .yaml
-        config_files = []
-        for config_file in os.listdir(self._lb_configs_dir):
-            if config_file.endswith((".yml", ".yaml")):
-                config_files.append(config_file)
+            try:
+                with os.scandir(self._lb_configs_dir) as entries:
+                    self._lb_config_files = [
+                        (entry.name, entry.path) for entry in entries
+                        if entry.name.endswith((".yml", ".yaml")) and entry.is_file()
+                    ]
+            except OSError as e:
+                raise ConfigError(f"Failed to list the load balancers configuration directory {self._lb_configs_dir}: {e}")
+            self._lb_configs_dir_mtime_ns = dir_mtime_ns
+
+            # Forget the configuration files which were removed
+            config_paths = {config_path for _, config_path in self._lb_config_files}
+            for config_path in self._parsed_cache.keys() - config_paths:
+                del self._parsed_cache[config_path]
 
         # For each configuration file...
-        for config_file in config_files:
+        for config_file, config_path in self._lb_config_files:
 
-            schema = _LOADBALANCER_SCHEMA.copy()
             validation_error = f"Failed to parse the load balancer configuration file {config_file}"
 
-            # Load the YAML configuration
-            config_path = os.path.join(self._lb_configs_dir, config_file)
-            with open(config_path, "r") as f:
-                config = yaml.safe_load(f)
+            # Reuse the previously validated configuration if the file didn't change
+            try:
+                config_stat = os.stat(config_path)
+            except OSError as e:
+                raise ConfigError(f"{validation_error}: {e}")
+            cached = self._parsed_cache.get(config_path)
+            if cached is not None and cached[0:2] == (config_stat.st_mtime_ns, config_stat.st_size):
+                yield cached[2]
+                continue
+
+            # Load the YAML configuration, read as bytes so that decoding errors are reported by the YAML reader
+            try:
+                with open(config_path, "rb") as f:
+                    config = yaml.load(f, Loader=_SafeLoader)
+            except (yaml.YAMLError, OSError) as e:
+                raise ConfigError(f"{validation_error}: {e}")
 
-            # Perform a first validation of the load balancer configuration
-            self._validate_or_raise(schema, config, validation_error)
+            # Validate the load balancer configuration in a single pass with the healthcheck schema
+            # when its type is known, the generic schema reports the errors otherwise
+            try:
+                validator = _LB_VALIDATORS_BY_HC[config["healthcheck"]["type"]]
+            except (KeyError, TypeError):
+                validator = _LB_VALIDATOR
+            config = self._validate_or_raise(validator, config, validation_error)
 
-            # Perform a second validation of the load balancer configuration with the healthcheck schema
-            schema["healthcheck"]["schema"]["config"]["schema"] = schemas[config["healthcheck"]["type"]]
-            yield self._validate_or_raise(schema, config, validation_error)
+            self._parsed_cache[config_path] = (config_stat.st_mtime_ns, config_stat.st_size, config)
+            yield config
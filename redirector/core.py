@@ -1,11 +1,35 @@
+from collections import deque
 from logging.handlers import RotatingFileHandler
 from redirector.config import ConfigError, ConfigLoader
+from redirector.healthchecks import create_healthcheck
 from redirector.hostsmanager import HostsManager, HostsManagerError
 from redirector.loadbalancer import LoadBalancer
+from threading import Event
 
 import logging
 import os
-import queue
+import re
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Time (in seconds) given to the load balancers to finish their healthcheck when stopping the program
+_STOP_TIMEOUT = 2
+
+
+def _freeze(value):
+    """Convert a configuration value to a hashable one.
+
+    :value: Configuration value
+    :returns: Hashable value
+    """
+
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+
+    return value
 
 
 class Redirector(object):
@@ -16,8 +40,11 @@ class Redirector(object):
         self._config = None
         self._configloader = ConfigLoader(config_path)
         self._hostsmanager = HostsManager()
+        self._lb_configs = []
         self._load_balancers = {}
-        self._queue = queue.Queue()
+        self._queue = deque()
+        self._queue_event = Event()
+        self._reload = False
         self._run = True
 
     def _setup_logging(self):
@@ -40,48 +67,81 @@ class Redirector(object):
         root_logger.setLevel(self._config["log_level"])
         root_logger.addHandler(handler)
 
-    def _initialise_components(self):
-        """Initialise the components.
+    def _create_load_balancers(self, lb_configs, unchanged=None):
+        """Create the load balancers from their configurations.
 
-        :configloader: ConfigLoader instance
-        :returns: Nothing
+        :lb_configs: List of load balancer configurations
+        :unchanged: Dict with the running load balancers to reuse by name, as their configuration didn't change
+        :returns: Tuple (Dict with the load balancers by name, Set of expected hostnames)
+        :raises: RuntimeError in case of error
         """
 
-        try:
+        if unchanged is None:
+            unchanged = {}
 
-            # Load the already defined entries in the /etc/hosts file
-            self._hostsmanager.load_persisted_entries()
+        load_balancers = {}
+        expected_hostnames = set()
+        shared_healthchecks = {}
 
-            expected_hostnames = []
+        for config in lb_configs:
 
-            # Load the load balancer configurations
-            for config in self._configloader.load_lb_configs():
+            lb_name = config["name"]
 
-                lb_name = config["name"]
+            # Make sure the load balancer name is unique
+            if lb_name in load_balancers:
+                _logger.critical('Two load balancers named "%s" were defined.', lb_name)
+                raise RuntimeError()
 
-                # Make sure the load balancer name is unique
-                if lb_name in self._load_balancers.keys():
-                    logging.critical('Two load balancers named "{lb_name}" were defined.')
+            # Add the hostname to the set of expected hostnames
+            expected_hostnames.add(config["local_host"])
+
+            # Reuse the running load balancer if its configuration didn't change
+            if lb_name in unchanged:
+                load_balancers[lb_name] = unchanged[lb_name]
+                continue
+
+            # Share the healthcheck between load balancers with the same healthcheck configuration
+            hc_config = config["healthcheck"]
+            hc_key = (hc_config["type"], _freeze(hc_config["config"]), hc_config["cache_ttl"])
+            if hc_key not in shared_healthchecks:
+                try:
+                    shared_healthchecks[hc_key] = create_healthcheck(hc_config)
+                except (OSError, ValueError, re.error) as e:
+                    _logger.critical('Failed to create the healthcheck of load balancer "%s": %s', lb_name, e)
                     raise RuntimeError()
 
-                # Create the load balancer object
-                load_balancer = LoadBalancer(config, self._queue)
-                logging.info(f'Load balancer "{lb_name}" loaded.')
-                self._load_balancers[lb_name] = load_balancer
+            # Create the load balancer object
+            load_balancer = LoadBalancer(config, self._queue, self._queue_event, shared_healthchecks[hc_key])
+            _logger.info('Load balancer "%s" loaded.', lb_name)
+            load_balancers[lb_name] = load_balancer
 
-                # Add the hostname to the list of expected hostnames
-                expected_hostnames.append(config["local_host"])
+        # Make sure at least one load balancer was configured
+        if len(load_balancers) == 0:
+            _logger.critical("No load balancer was defined.")
+            raise RuntimeError()
 
-            # Make sure at least one load balancer was configured
-            if len(self._load_balancers) == 0:
-                logging.critical("No load balancer was defined.")
-                raise RuntimeError()
+        return load_balancers, expected_hostnames
+
+    def _initialise_components(self):
+        """Initialise the components.
+
+        :returns: Nothing
+        """
+
+        try:
+
+            # Load the already defined entries in the /etc/hosts file
+            self._hostsmanager.load_persisted_entries()
+
+            # Load the load balancer configurations
+            self._lb_configs = list(self._configloader.load_lb_configs())
+            self._load_balancers, expected_hostnames = self._create_load_balancers(self._lb_configs)
 
             # Inform the HostsManager about expected hostnames
             self._hostsmanager.remove_unexpected_entries(expected_hostnames)
 
         except (ConfigError, HostsManagerError) as e:
-            logging.critical(e)
+            _logger.critical(e)
             raise RuntimeError()
 
     def initialise(self):
@@ -104,24 +164,102 @@ class Redirector(object):
         # Setup logging
         self._setup_logging()
 
-        logging.info("Redirector is starting...")
+        _logger.info("Redirector is starting...")
 
         # Initialise the components
         self._initialise_components()
 
-    def _do_stop(self):
-        """Stop the program.
+    def _stop_load_balancers(self, load_balancers, timeout=None):
+        """Stop the load balancers and wait for their threads to finish.
 
+        :load_balancers: Dict with the load balancers to stop by name
+        :timeout: Time (in seconds) to wait for all the threads, None to wait until they finish
         :returns: Nothing
         """
 
         # Stop load balancers
-        for lb in self._load_balancers.values():
+        for lb in load_balancers.values():
             lb.stop()
 
-        # Wait for all load balancer threads to finish
-        for lb in self._load_balancers.values():
-            lb.join()
+        # Wait for all load balancer threads to finish, against a single deadline
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for lb_name, lb in load_balancers.items():
+            lb.join(None if deadline is None else max(0, deadline - time.monotonic()))
+            if lb.is_alive():
+                _logger.warning('Load balancer "%s" didn\'t stop in time, its healthcheck is abandoned.', lb_name)
+
+    def _do_reload(self):
+        """Reload the load balancers, restarting them only if their configurations changed.
+
+        :returns: Nothing
+        """
+
+        _logger.info("Reloading the load balancers configurations...")
+
+        # Load the load balancer configurations, unchanged files aren't parsed again
+        try:
+            lb_configs = list(self._configloader.load_lb_configs())
+        except ConfigError as e:
+            _logger.error(e)
+            _logger.error("The running load balancers are kept.")
+            return
+
+        if lb_configs == self._lb_configs:
+            _logger.info("The load balancers configurations didn't change.")
+            return
+
+        # Identify the running load balancers whose configuration didn't change
+        new_configs = {config["name"]: config for config in lb_configs}
+        unchanged = {
+            config["name"]: self._load_balancers[config["name"]] for config in self._lb_configs
+            if new_configs.get(config["name"]) == config
+        }
+
+        # Create the new load balancers before stopping the changed or removed ones
+        try:
+            load_balancers, expected_hostnames = self._create_load_balancers(lb_configs, unchanged)
+        except RuntimeError:
+            _logger.error("The running load balancers are kept.")
+            return
+
+        # Stop the changed or removed load balancers
+        self._stop_load_balancers({name: lb for name, lb in self._load_balancers.items() if name not in unchanged})
+        self._lb_configs = lb_configs
+        self._load_balancers = load_balancers
+
+        # Drop the DNS configurations the stopped load balancers didn't apply yet, keeping the other ones
+        # in front of the queue as the unchanged load balancers may still append to it
+        unchanged_hostnames = {new_configs[name]["local_host"] for name in unchanged}
+        pending_entries = [self._queue.popleft() for _ in range(len(self._queue))]
+        for entry in reversed(pending_entries):
+            if entry[0] in unchanged_hostnames:
+                self._queue.appendleft(entry)
+
+        # Start the new load balancer threads
+        for lb_name, lb in self._load_balancers.items():
+            if lb_name not in unchanged:
+                lb.start()
+
+        try:
+
+            # Inform the HostsManager about expected hostnames
+            self._hostsmanager.remove_unexpected_entries(expected_hostnames)
+
+        except HostsManagerError as e:
+            _logger.critical(e)
+            self._run = False
+            return
+
+        _logger.info("Load balancers reloaded.")
+
+    def _do_stop(self):
+        """Stop the program.
+
+        :returns: Nothing
+        """
+
+        # Stop load balancers, without waiting for slow healthchecks whose result won't be used
+        self._stop_load_balancers(self._load_balancers, _STOP_TIMEOUT)
 
         # Remove the block in the /etc/hosts file if configured
         if not self._config["persist_hosts_block"]:
@@ -141,29 +279,42 @@ class Redirector(object):
         for lb in self._load_balancers.values():
             lb.start()
 
-        logging.info("Redirector started.")
+        _logger.info("Redirector started.")
 
-        while self._run:
+        try:
+
+            while self._run:
 
-            try:
+                # Reload the load balancers if requested
+                if self._reload:
+                    self._reload = False
+                    self._do_reload()
+                    continue
 
-                # Get a potentially new DNS configuration from the queue
-                local_host, backend_host = self._queue.get(timeout=1)
+                # Wait for potentially new DNS configurations
+                if not self._queue_event.wait(timeout=1):
+                    continue
+                self._queue_event.clear()
 
-                # Update or insert it to the DNS configuration
-                self._hostsmanager.upsert_entry(local_host, backend_host)
+                # Drain the pending DNS configurations
+                entries = []
+                while self._queue:
+                    entries.append(self._queue.popleft())
 
-            except queue.Empty:
-                pass
+                try:
 
-            except HostsManagerError as e:
-                logging.critical(e)
-                self._run = False
+                    # Update or insert them to the DNS configuration at once
+                    self._hostsmanager.upsert_entries(entries)
 
-        # Stop components
-        self._do_stop()
+                except HostsManagerError as e:
+                    _logger.critical(e)
+                    self._run = False
 
-        logging.info("Redirector stopped.")
+        # Stop components, even if an unexpected error occurred
+        finally:
+            self._do_stop()
+
+        _logger.info("Redirector stopped.")
 
     def stop(self):
         """Stop active load balancers.
@@ -172,3 +323,12 @@ class Redirector(object):
         """
 
         self._run = False
+
+    def reload(self):
+        """Reload the load balancers configurations.
+        The reload is performed by the main loop.
+
+        :returns: Nothing
+        """
+
+        self._reload = True
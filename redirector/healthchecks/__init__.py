@@ -1,4 +1,5 @@
 from redirector.healthchecks import http, tcp
+from redirector.healthchecks.cache import CachedHealthCheck
 
 healthchecks = {
     "http": http.HttpHealthCheck,
@@ -9,3 +10,19 @@ schemas = {
     "http": http.CONFIG_SCHEMA,
     "tcp": tcp.CONFIG_SCHEMA
 }
+
+
+def create_healthcheck(config):
+    """Create the healthcheck of a load balancer.
+
+    :config: Healthcheck section of the load balancer configuration
+    :returns: Healthcheck
+    """
+
+    healthcheck = healthchecks[config["type"]](config["config"])
+
+    # Reuse the recent results of the healthcheck if requested
+    if config["cache_ttl"] > 0:
+        healthcheck = CachedHealthCheck(healthcheck, config["cache_ttl"])
+
+    return healthcheck
@@ -1,12 +1,27 @@
 class BaseHealthCheck(object):
+
+    __slots__ = ()
+
     def __init__(self):
         pass
 
     def is_alive(self, host):
         """Perform an healthcheck against the given host.
+        A healthcheck may be shared between load balancers, so this method
+        can be called concurrently from several threads.
 
         :host: Host to check
         :returns: Tuple (Host alive, message)
         """
 
         raise NotImplementedError
+
+    def check_many(self, hosts):
+        """Perform an healthcheck against each of the given hosts.
+        Healthchecks able to probe several hosts at once can override this method.
+
+        :hosts: Iterable of hosts to check
+        :returns: Dict with a tuple (Host alive, message) by host
+        """
+
+        return {host: self.is_alive(host) for host in hosts}
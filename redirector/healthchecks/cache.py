@@ -0,0 +1,74 @@
+from redirector.healthchecks.base import BaseHealthCheck
+from threading import Lock
+
+import time
+
+
+class CachedHealthCheck(BaseHealthCheck):
+
+    __slots__ = ("_healthcheck", "_ttl", "_results", "_lock")
+
+    def __init__(self, healthcheck, ttl):
+        """Constructor of the class.
+
+        :healthcheck: Healthcheck whose results are cached
+        :ttl: Time (in seconds) during which a result is reused
+        """
+
+        super().__init__()
+
+        self._healthcheck = healthcheck
+        self._ttl = ttl
+        self._results = {}
+        self._lock = Lock()
+
+    def is_alive(self, host):
+        """Perform an healthcheck against the given host, reusing a recent result if possible.
+
+        :host: Host to check
+        :returns: Tuple (Host alive, message)
+        """
+
+        # Reuse the cached result if it didn't expire
+        now = time.monotonic()
+        with self._lock:
+            cached = self._results.get(host)
+        if cached is not None and now < cached[2]:
+            return cached[0], cached[1]
+
+        # Perform the healthcheck without holding the lock and cache its result
+        alive, msg = self._healthcheck.is_alive(host)
+        with self._lock:
+            self._results[host] = (alive, msg, time.monotonic() + self._ttl)
+
+        return alive, msg
+
+    def check_many(self, hosts):
+        """Perform an healthcheck against each of the given hosts, reusing recent results if possible.
+
+        :hosts: Iterable of hosts to check
+        :returns: Dict with a tuple (Host alive, message) by host
+        """
+
+        # Reuse the cached results which didn't expire
+        results = {}
+        now = time.monotonic()
+        with self._lock:
+            for host in hosts:
+                cached = self._results.get(host)
+                if cached is not None and now < cached[2]:
+                    results[host] = (cached[0], cached[1])
+                else:
+                    results[host] = None
+
+        # Check the other hosts at once and cache their results
+        missing = [host for host, result in results.items() if result is None]
+        if missing:
+            checked = self._healthcheck.check_many(missing)
+            expiry = time.monotonic() + self._ttl
+            with self._lock:
+                for host, (alive, msg) in checked.items():
+                    self._results[host] = (alive, msg, expiry)
+            results.update(checked)
+
+        return results
@@ -1,10 +1,65 @@
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
 from redirector.healthchecks.base import BaseHealthCheck
-from urllib.error import HTTPError, URLError
+from redirector.healthchecks.runner import shared_runner
 from urllib.parse import urlunparse
-from urllib.request import Request, urlopen
 
+import functools
+import os
 import re
 import socket
+import ssl
+import threading
+import time
+
+# Expected status made of status codes separated by "|" or ","
+_STATUS_CODES_RE = re.compile(r"\s*\d+(\s*[|,]\s*\d+)*\s*")
+
+# Time (in seconds) during which a keep-alive connection is reused, so that a new connection
+# is regularly opened and a backend no longer accepting connections is detected
+_CONNECTION_MAX_AGE = 30
+
+
+def _check_readable_file(field, value, error):
+    """Make sure a configuration value is the path of a readable file.
+
+    :field: Name of the validated field
+    :value: Value of the validated field
+    :error: Function reporting a validation error
+    :returns: Nothing
+    """
+
+    if value is not None and not (os.path.isfile(value) and os.access(value, os.R_OK)):
+        error(field, f'"{value}" is not a readable file')
+
+
+def _check_status_codes(field, value, error):
+    """Make sure the expected status codes aren't booleans, which would be accepted as integers.
+
+    :field: Name of the validated field
+    :value: Value of the validated field
+    :error: Function reporting a validation error
+    :returns: Nothing
+    """
+
+    codes = value if isinstance(value, list) else [value]
+    if any(isinstance(code, bool) for code in codes):
+        error(field, "status codes must be integers, not booleans")
+
+
+def _check_regex(field, value, error):
+    """Make sure a configuration value is a valid regular expression if it is a string.
+
+    :field: Name of the validated field
+    :value: Value of the validated field
+    :error: Function reporting a validation error
+    :returns: Nothing
+    """
+
+    if isinstance(value, str):
+        try:
+            re.compile(value)
+        except re.error as e:
+            error(field, f'"{value}" is not a valid regular expression ({e})')
 
 
 CONFIG_SCHEMA = {
@@ -15,17 +70,30 @@ CONFIG_SCHEMA = {
         "default": "GET"
     },
     "headers": {
-        "type": "list",
         "required": False,
-        "schema": {
-            "type": "dict",
-            "keysrules": {
-                "type": "string"
+        "anyof": [
+            {
+                "type": "dict",
+                "keysrules": {
+                    "type": "string"
+                },
+                "valuesrules": {
+                    "type": "string"
+                }
             },
-            "valuesrules": {
-                "type": "string"
+            {
+                "type": "list",
+                "schema": {
+                    "type": "dict",
+                    "keysrules": {
+                        "type": "string"
+                    },
+                    "valuesrules": {
+                        "type": "string"
+                    }
+                }
             }
-        },
+        ],
         "default": {}
     },
     "scheme": {
@@ -60,17 +128,24 @@ CONFIG_SCHEMA = {
         "type": "string",
         "required": False,
         "nullable": True,
+        "check_with": _check_readable_file,
         "default": None
     },
     "expected_status": {
-        "type": "string",
+        "type": ["string", "integer", "list"],
         "required": False,
+        "minlength": 1,
+        "schema": {
+            "type": "integer"
+        },
+        "check_with": [_check_status_codes, _check_regex],
         "default": "200"
     },
     "expected_response": {
         "type": "string",
         "required": False,
         "nullable": True,
+        "check_with": _check_regex,
         "default": None
     },
     "expected_response_encoding": {
@@ -81,8 +156,41 @@ CONFIG_SCHEMA = {
 }
 
 
+@functools.lru_cache(maxsize=16)
+def _get_ssl_context(cacerts, cacerts_mtime_ns):
+    """Get an SSL context shared by the HTTPS healthchecks using the same CA certificates.
+
+    :cacerts: Path to alternative CA certificates, None to use the default ones
+    :cacerts_mtime_ns: Modification time of the CA certificates, so updated ones are loaded again
+    :returns: SSLContext
+    """
+
+    return ssl.create_default_context(cafile=cacerts)
+
+
 class HttpHealthCheck(BaseHealthCheck):
 
+    __slots__ = (
+        "_method",
+        "_headers",
+        "_scheme",
+        "_port",
+        "_path",
+        "_query",
+        "_timeout",
+        "_cacerts",
+        "_expected_status",
+        "_expected_response",
+        "_expected_response_encoding",
+        "_expected_codes",
+        "_expected_status_re",
+        "_expected_response_re",
+        "_target",
+        "_ssl_context",
+        "_connections",
+        "_connections_lock"
+    )
+
     def __init__(self, config):
         """Constructor of the class.
 
@@ -92,6 +200,8 @@ class HttpHealthCheck(BaseHealthCheck):
 
         self._method = config["method"]
         self._headers = config["headers"]
+        if isinstance(self._headers, list):
+            self._headers = {k: v for headers in self._headers for k, v in headers.items()}
         self._scheme = config["scheme"]
         self._port = config["port"]
         self._path = config["path"]
@@ -102,6 +212,94 @@ class HttpHealthCheck(BaseHealthCheck):
         self._expected_response = config["expected_response"]
         self._expected_response_encoding = config["expected_response_encoding"]
 
+        # Identify the expected status codes, a regex is only compiled if they can't be listed
+        if isinstance(self._expected_status, int):
+            self._expected_codes = frozenset([self._expected_status])
+        elif isinstance(self._expected_status, list):
+            self._expected_codes = frozenset(self._expected_status)
+        elif _STATUS_CODES_RE.fullmatch(self._expected_status):
+            self._expected_codes = frozenset(int(code) for code in re.split(r"[|,]", self._expected_status))
+        else:
+            self._expected_codes = None
+        if self._expected_codes is None:
+            self._expected_status_re = re.compile(self._expected_status)
+        else:
+            self._expected_status_re = None
+        if self._expected_response is not None:
+            self._expected_response_re = re.compile(self._expected_response)
+        else:
+            self._expected_response_re = None
+
+        # Target of the HTTP request and SSL context used for HTTPS
+        path = self._path if self._path.startswith("/") else f"/{self._path}"
+        self._target = urlunparse(("", "", path, None, self._query, None))
+        if self._scheme == "https":
+            cacerts_mtime_ns = os.stat(self._cacerts).st_mtime_ns if self._cacerts is not None else None
+            self._ssl_context = _get_ssl_context(self._cacerts, cacerts_mtime_ns)
+        else:
+            self._ssl_context = None
+
+        # Idle keep-alive connections, by host
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+
+    def _new_connection(self, host):
+        """Create a new connection to the given host.
+
+        :host: Host to connect to
+        :returns: HTTPConnection or HTTPSConnection
+        """
+
+        if self._ssl_context is not None:
+            return HTTPSConnection(host, self._port, timeout=self._timeout, context=self._ssl_context)
+        else:
+            return HTTPConnection(host, self._port, timeout=self._timeout)
+
+    def _get_connection(self, host):
+        """Get an idle connection to the given host or create a new one.
+
+        :host: Host to connect to
+        :returns: Tuple (Connection, Expiry time of the connection, True if it was reused)
+        """
+
+        with self._connections_lock:
+            idle_connections = self._connections.get(host)
+            idle_connection = idle_connections.pop() if idle_connections else None
+
+        # Reuse the idle connection unless it is too old
+        now = time.monotonic()
+        if idle_connection is not None:
+            connection, expiry = idle_connection
+            if now < expiry:
+                return connection, expiry, True
+            connection.close()
+
+        return self._new_connection(host), now + _CONNECTION_MAX_AGE, False
+
+    def _release_connection(self, host, connection, expiry):
+        """Keep a connection open to reuse it for the next healthchecks.
+
+        :host: Host of the connection
+        :connection: Connection to release
+        :expiry: Time after which the connection mustn't be reused
+        :returns: Nothing
+        """
+
+        with self._connections_lock:
+            self._connections.setdefault(host, []).append((connection, expiry))
+
+    def _request(self, connection):
+        """Send the HTTP request and read the whole response.
+
+        :connection: Connection on which the request is sent
+        :returns: Tuple (Response, Response body)
+        """
+
+        connection.request(self._method, self._target, headers=self._headers)
+        response = connection.getresponse()
+
+        return response, response.read()
+
     def is_alive(self, host):
         """Perform an HTTP request against the given host.
 
@@ -109,37 +307,59 @@ class HttpHealthCheck(BaseHealthCheck):
         :returns: True if successful, False otherwise
         """
 
-        # Build the URL
-        netloc = f"{host}:{self._port}"
-        url = urlunparse((self._scheme, netloc, self._path, None, self._query, None))
+        connection, expiry, reused = self._get_connection(host)
 
         try:
-            request = Request(
-                url,
-                method=self._method,
-                headers=self._headers
-            )
 
-            with urlopen(request, timeout=self._timeout, cafile=self._cacerts) as response:
+            try:
+                response, body = self._request(connection)
+
+            # The backend may have closed a kept-alive connection, retry with a new one
+            except (ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                connection.close()
+                connection = self._new_connection(host)
+                expiry = time.monotonic() + _CONNECTION_MAX_AGE
+                response, body = self._request(connection)
+
+        except socket.timeout:
+            connection.close()
+            return False, f"Timeout ({self._timeout})"
 
-                # Make sure we didn't get a wrong HTTP status code
-                if re.search(str(response.code), self._expected_status) is None:
-                    return False, f'Got HTTP code "{response.code}" instead of "{self._expected_status}"'
+        except (HTTPException, OSError) as e:
+            connection.close()
+            return False, f"Connection error ({e})"
 
-                # If <expected_response> was specified, make sure we didn't get a wrong response
-                if self._expected_response is not None:
-                    decoded_response = response.read().decode(self._expected_response_encoding)
-                    if re.search(decoded_response, self._expected_response) is None:
-                        return False, f'The HTTP response didn\'t match the expected response "{self._expected_response}"'
+        # Keep the connection open unless the backend is closing it
+        if response.will_close:
+            connection.close()
+        else:
+            self._release_connection(host, connection, expiry)
 
-                # No error was encountered, the host is alive
-                return True, "OK"
+        # Make sure we didn't get a wrong HTTP status code
+        if self._expected_codes is not None:
+            status_matched = response.status in self._expected_codes
+        else:
+            status_matched = self._expected_status_re.search(str(response.status)) is not None
+        if not status_matched:
+            return False, f'Got HTTP code "{response.status}" instead of "{self._expected_status}"'
 
-        except HTTPError as e:
-            return False, f"HTTP error ({e.code})"
+        # If <expected_response> was specified, make sure we didn't get a wrong response
+        if self._expected_response_re is not None:
+            decoded_response = body.decode(self._expected_response_encoding)
+            if self._expected_response_re.search(decoded_response) is None:
+                return False, f'The HTTP response didn\'t match the expected response "{self._expected_response}"'
 
-        except URLError as e:
-            return False, f"URL error ({e.reason})"
+        # No error was encountered, the host is alive
+        return True, "OK"
 
-        except socket.timeout:
-            return False, f"Timeout ({self._timeout})"
+    def check_many(self, hosts):
+        """Perform an HTTP request against each of the given hosts concurrently.
+
+        :hosts: Iterable of hosts to check
+        :returns: Dict with a tuple (Host alive, message) by host
+        """
+
+        # Run the requests on the threads shared by the healthchecks, they are bounded by the timeout
+        return shared_runner.check_all(self, hosts)
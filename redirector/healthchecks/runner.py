@@ -0,0 +1,77 @@
+from threading import Lock, Thread
+
+import queue
+
+
+class HealthCheckRunner(object):
+
+    __slots__ = ("_max_workers", "_workers", "_idle_workers", "_tasks", "_lock")
+
+    def __init__(self, max_workers=32):
+        """Constructor of the class.
+
+        :max_workers: Maximum number of healthchecks running at the same time
+        """
+
+        self._max_workers = max_workers
+        self._workers = 0
+        self._idle_workers = 0
+        self._tasks = queue.Queue()
+        self._lock = Lock()
+
+    def _work(self):
+        """Run the healthchecks submitted to the runner, forever.
+
+        :returns: Nothing
+        """
+
+        while True:
+
+            # Wait for a healthcheck to run
+            with self._lock:
+                self._idle_workers += 1
+            healthcheck, host, results = self._tasks.get()
+            with self._lock:
+                self._idle_workers -= 1
+
+            # Run it and send its result, or the error it raised, back to the caller
+            try:
+                result = healthcheck.is_alive(host)
+            except Exception as e:
+                result = e
+            results.put((host, result))
+
+    def check_all(self, healthcheck, hosts):
+        """Perform the healthcheck against each of the given hosts in parallel.
+
+        :healthcheck: Healthcheck to perform
+        :hosts: Iterable of hosts to check
+        :returns: Dict with a tuple (Host alive, message) by host
+        """
+
+        hosts = set(hosts)
+        results = queue.Queue()
+
+        # Submit the healthchecks, starting new workers only if the idle ones can't take them
+        for host in hosts:
+            self._tasks.put((healthcheck, host, results))
+            with self._lock:
+                start_worker = self._idle_workers < self._tasks.qsize() and self._workers < self._max_workers
+                if start_worker:
+                    self._workers += 1
+            if start_worker:
+                Thread(target=self._work, name="healthcheck-runner", daemon=True).start()
+
+        # Collect the results as they come
+        checked = {}
+        for _ in range(len(hosts)):
+            host, result = results.get()
+            if isinstance(result, Exception):
+                raise result
+            checked[host] = result
+
+        return checked
+
+
+# Runner shared by the healthchecks, so that its threads are reused between calls
+shared_runner = HealthCheckRunner()
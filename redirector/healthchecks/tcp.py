@@ -1,7 +1,11 @@
 from redirector.healthchecks.base import BaseHealthCheck
 
 import errno
+import os
+import selectors
 import socket
+import struct
+import time
 
 
 CONFIG_SCHEMA = {
@@ -19,9 +23,28 @@ CONFIG_SCHEMA = {
     }
 }
 
+# Time (in seconds) during which a resolved address is reused
+_DNS_TTL = 60
+
+# SO_LINGER option resetting the connection on close, so it doesn't stay in TIME_WAIT
+_LINGER_RESET = struct.pack("ii", 1, 0)
+
+# Messages of the common connection errors, other errors are reported with their description
+_ERRNO_MESSAGES = {
+    errno.ECONNREFUSED: "Connection refused",
+    errno.ECONNRESET: "Connection reset",
+    errno.EHOSTUNREACH: "No route to host",
+    errno.ENETUNREACH: "Network unreachable",
+    errno.ETIMEDOUT: "Connection timed out",
+    errno.EACCES: "Permission denied",
+    errno.EPIPE: "Broken pipe"
+}
+
 
 class TcpHealthCheck(BaseHealthCheck):
 
+    __slots__ = ("_port", "_timeout", "_addr_cache")
+
     def __init__(self, config):
         """Constructor of the class.
 
@@ -32,6 +55,29 @@ class TcpHealthCheck(BaseHealthCheck):
         self._port = config["port"]
         self._timeout = config["timeout"]
 
+        # Resolved addresses, by host: (expiry time, address info)
+        self._addr_cache = {}
+
+    def _resolve(self, host):
+        """Resolve the address of the given host, reusing it until its expiry.
+
+        :host: Host to resolve
+        :returns: Tuple (family, type, proto, canonname, sockaddr)
+        :raises: socket.gaierror in case of error
+        """
+
+        # Reuse the cached address if it didn't expire
+        now = time.monotonic()
+        cached = self._addr_cache.get(host)
+        if cached is not None and now < cached[0]:
+            return cached[1]
+
+        # Resolve the address and cache it
+        addr_info = socket.getaddrinfo(host, self._port, socket.AF_UNSPEC, socket.SOCK_STREAM)[0]
+        self._addr_cache[host] = (now + _DNS_TTL, addr_info)
+
+        return addr_info
+
     def is_alive(self, host):
         """Perform a TCP handshake against the given host.
 
@@ -39,26 +85,93 @@ class TcpHealthCheck(BaseHealthCheck):
         :returns: True if successful, False otherwise
         """
 
-        try:
+        return self.check_many([host])[host]
+
+    def _connection_failure(self, host, error):
+        """Build the result of a failed connection, forgetting the address of the host.
+
+        :host: Checked host
+        :error: OSError raised by the connection
+        :returns: Tuple (False, message)
+        """
+
+        self._addr_cache.pop(host, None)
+        msg = _ERRNO_MESSAGES.get(error.errno)
+        if msg is None:
+            msg = f"OS error: {error}"
 
-            # Create the TCP socket
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self._timeout)
+        return False, msg
 
-            # Connect to the backend
-            sock.connect((host, self._port))
-            sock.close()
+    def check_many(self, hosts):
+        """Perform a TCP handshake against each of the given hosts at once.
+        All the connections are started before waiting for any of them, so the whole
+        check takes as long as the slowest host instead of the sum of all of them.
 
-            return True, "OK"
+        :hosts: Iterable of hosts to check
+        :returns: Dict with a tuple (Host alive, message) by host
+        """
 
-        except socket.timeout:
-            return False, f"Timeout ({self._timeout})"
+        results = {}
+        selector = selectors.DefaultSelector()
 
-        except socket.gaierror:
-            return False, "DNS resolution failed"
+        try:
 
-        except OSError as e:
-            if e.errno == errno.ECONNREFUSED:
-                return False, "Connection refused"
-            else:
-                return False, f"OS error: {e}"
+            # Start connecting to every host
+            for host in hosts:
+                if host in results:
+                    continue
+
+                try:
+                    family, type, proto, _, sockaddr = self._resolve(host)
+                except socket.gaierror:
+                    results[host] = (False, "DNS resolution failed")
+                    continue
+
+                sock = None
+                try:
+                    sock = socket.socket(family, type, proto)
+                    sock.setblocking(False)
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RESET)
+                    error = sock.connect_ex(sockaddr)
+                except OSError as e:
+                    if sock is not None:
+                        sock.close()
+                    results[host] = self._connection_failure(host, e)
+                    continue
+
+                # Wait for the pending handshakes, the other ones completed or failed immediately
+                if error == errno.EINPROGRESS:
+                    selector.register(sock, selectors.EVENT_WRITE, host)
+                    results[host] = None
+                else:
+                    sock.close()
+                    results[host] = (True, "OK") if error == 0 else self._connection_failure(host, OSError(error, os.strerror(error)))
+
+            # Collect the handshakes as they complete, until the timeout
+            deadline = time.monotonic() + self._timeout
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                for key, _ in selector.select(remaining):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    sock.close()
+                    results[key.data] = (True, "OK") if error == 0 else self._connection_failure(key.data, OSError(error, os.strerror(error)))
+
+            # The handshakes still pending timed out
+            for key in selector.get_map().values():
+                self._addr_cache.pop(key.data, None)
+                results[key.data] = (False, f"Timeout ({self._timeout})")
+
+        finally:
+
+            # Close the sockets still registered
+            for key in list(selector.get_map().values()):
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+            selector.close()
+
+        return results
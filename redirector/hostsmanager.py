@@ -1,12 +1,34 @@
+import ipaddress
+import mmap
 import os
 import re
 import socket
 import stat
+import sys
 import tempfile
+import time
+
+_HOSTS_PATH = "/etc/hosts"
 
 _BEGIN_MARKER = "# BEGIN REDIRECTOR MANAGED BLOCK\n"
 _END_MARKER = "# END REDIRECTOR MANAGED BLOCK\n"
 
+# Markers as found in the /etc/hosts file, which is handled as bytes
+_BEGIN_MARKER_B = _BEGIN_MARKER.encode()
+_END_MARKER_B = _END_MARKER.encode()
+
+# Regexes locating the markers at the beginning of a line and parsing the block entries,
+# lines of the /etc/hosts file may end with either LF or CRLF
+_BEGIN_MARKER_RE = re.escape(_BEGIN_MARKER_B[:-1]) + b"\r?\n"
+_END_MARKER_RE = re.escape(_END_MARKER_B[:-1]) + b"\r?\n"
+_BEGIN_RE = re.compile(b"^" + _BEGIN_MARKER_RE, re.M)
+_END_RE = re.compile(b"^" + _END_MARKER_RE, re.M)
+_BLOCK_RE = re.compile(b"^" + _BEGIN_MARKER_RE + b"(.*?)^" + _END_MARKER_RE, re.M | re.S)
+_ENTRY_RE = re.compile(b"^([^ \r\n]+) +([^\r\n]+)\r?\n", re.M)
+
+# Time (in seconds) during which a resolved backend address is reused
+_DNS_TTL = 60
+
 
 class HostsManagerError(Exception):
     pass
@@ -18,88 +40,149 @@ class HostsManager(object):
 
         self._entries = {}
 
-    def _generate_redirector_block_content(self):
+        # Generated redirector block, reset to None whenever the entries change
+        self._block = None
+
+        # Resolved backend addresses, by host: (IP address, expiry time)
+        self._dns_cache = {}
+
+        # Location of the temporary hosts files: (Device of the /etc/hosts file, directory, prefix)
+        self._tmp_location = None
+
+    def _resolve(self, host):
+        """Resolve the IP address of the given host, reusing it until its expiry.
+
+        :host: Host to resolve
+        :returns: IP address
+        """
+
+        # Use IP addresses as is, without querying the resolver
+        try:
+            return str(ipaddress.ip_address(host))
+        except ValueError:
+            pass
+
+        # Reuse the cached address if it didn't expire
+        now = time.monotonic()
+        cached = self._dns_cache.get(host)
+        if cached is not None and now < cached[1]:
+            return cached[0]
+
+        # Resolve the address and cache it
+        ip = socket.gethostbyname(host)
+        self._dns_cache[host] = (ip, now + _DNS_TTL)
+
+        return ip
+
+    def _generate_redirector_block_bytes(self):
         """Generate the Redirector block.
 
-        :returns: List of lines for the /etc/hosts file
+        :returns: Encoded block for the /etc/hosts file
         """
 
-        # Add a minimum of two spaces after the IP
-        padding = max(len(ip) for ip in self._entries.values()) + 2
+        # Reuse the block if the entries didn't change since it was generated
+        if self._block is not None:
+            return self._block
 
-        # Generate the block
-        block = [_BEGIN_MARKER]
-        for hostname, ip in self._entries.items():
-            padded_ip = ip.ljust(padding)
-            block.append(f"{padded_ip}{hostname}\n")
-        block.append(_END_MARKER)
+        # Align the hostnames, with a minimum of two spaces after the longest IP
+        width = max(map(len, self._entries.values()), default=0)
 
-        return block
+        # Generate the entries, encode them at once and surround them with the markers
+        entries = "".join(f"{ip:<{width}}  {hostname}\n" for hostname, ip in self._entries.items())
 
-    def _rewrite_hosts_file(self, lines):
+        self._block = _BEGIN_MARKER_B + entries.encode() + _END_MARKER_B
+
+        return self._block
+
+    def _rewrite_hosts_file(self, content):
         """Rewrite the content of the /etc/hosts file.
 
-        :lines: List of lines to write to the file
+        :content: Bytes to write to the file
         :returns: Nothing
         :raises: HostsManagerError in case of error
         """
 
         # Identify the metadata of the original /etc/hosts file
-        hosts_stat = os.stat("/etc/hosts")
+        hosts_stat = os.stat(_HOSTS_PATH)
         mode = stat.S_IMODE(hosts_stat.st_mode)
         uid = hosts_stat.st_uid
         gid = hosts_stat.st_gid
 
-        # Create a temporary file, preferably in the default temporary directory
-        if hosts_stat.st_dev == os.stat(tempfile.gettempdir()).st_dev:
-            tmp_fd, tmp_path = tempfile.mkstemp(prefix="redirector_tmp_")
-        else:
-            tmp_fd, tmp_path = tempfile.mkstemp(prefix=".redirector_tmp_", dir="/etc")
+        # Choose the location of the temporary file, preferably the default temporary directory,
+        # as long as the /etc/hosts file stays on the same device
+        if self._tmp_location is None or self._tmp_location[0] != hosts_stat.st_dev:
+            tmp_dir = tempfile.gettempdir()
+            if hosts_stat.st_dev == os.stat(tmp_dir).st_dev:
+                self._tmp_location = (hosts_stat.st_dev, tmp_dir, "redirector_tmp_")
+            else:
+                self._tmp_location = (hosts_stat.st_dev, os.path.dirname(_HOSTS_PATH), ".redirector_tmp_")
 
-        # Write the result to the temporary file
-        with os.fdopen(tmp_fd, "w") as f:
-            f.write("".join(lines))
+        # Create the temporary file
+        _, tmp_dir, tmp_prefix = self._tmp_location
+        tmp_fd, tmp_path = tempfile.mkstemp(prefix=tmp_prefix, dir=tmp_dir)
 
-        # Apply the same permissions to the temporary file
-        os.chmod(tmp_path, mode)
         try:
-            os.chown(tmp_path, uid, gid)
-        except PermissionError:
-            raise HostsManagerError(f'Failed to change the owner / group of the temporary hosts file "{tmp_path}".')
 
-        # Replace the /etc/hosts file
-        os.replace(tmp_path, "/etc/hosts")
+            # Write the result to the temporary file and flush it to the disk
+            try:
+                view = memoryview(content)
+                while view:
+                    view = view[os.write(tmp_fd, view):]
+                os.fsync(tmp_fd)
+            finally:
+                os.close(tmp_fd)
+
+            # Apply the same permissions to the temporary file
+            os.chmod(tmp_path, mode)
+            try:
+                os.chown(tmp_path, uid, gid)
+            except PermissionError:
+                raise HostsManagerError(f'Failed to change the owner / group of the temporary hosts file "{tmp_path}".')
+
+            # Replace the /etc/hosts file
+            os.replace(tmp_path, _HOSTS_PATH)
+
+        # Do not leave the temporary file behind in case of error
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _find_redirector_block(self, content):
+        """Find the redirector block in the content of the /etc/hosts file.
+
+        :content: Bytes-like content of the /etc/hosts file
+        :returns: Match of the redirector block or None
+        :raises: HostsManagerError in case of error
+        """
+
+        # Try to find the redirector block
+        block = _BLOCK_RE.search(content)
+
+        # Make sure the redirector block is correct if a marker was found
+        if block is None:
+            begin_found = _BEGIN_RE.search(content) is not None
+            end_found = _END_RE.search(content) is not None
+            if begin_found and end_found:
+                raise HostsManagerError("The END marker was found before BEGIN marker in the /etc/hosts file.")
+            if begin_found:
+                raise HostsManagerError("Only the BEGIN marker was found in the /etc/hosts file.")
+            if end_found:
+                raise HostsManagerError("Only the END marker was found in the /etc/hosts file.")
+
+        return block
 
     def _read_hosts_file(self):
         """Read the /etc/hosts file.
 
-        :returns: Tuple (List with the file lines, BEGIN marker index, END marker index)
+        :returns: Tuple (File content, Match of the redirector block or None)
         :raises: HostsManagerError in case of error
         """
 
         # Read the hosts file
-        with open("/etc/hosts", "r") as f:
-            file_content = f.read()
-        file_lines = file_content.splitlines(True)
-
-        # Try to find the markers
-        begin_index = None
-        end_index = None
-        for i, line in enumerate(file_lines):
-            if line == _BEGIN_MARKER:
-                begin_index = i
-            if line == _END_MARKER:
-                end_index = i
-
-        # Make sure the redirector block is correct if found
-        if begin_index is not None and end_index is None:
-            raise HostsManagerError("Only the BEGIN marker was found in the /etc/hosts file.")
-        if begin_index is None and end_index is not None:
-            raise HostsManagerError("Only the END marker was found in the /etc/hosts file.")
-        if begin_index is not None and end_index is not None and begin_index > end_index:
-            raise HostsManagerError("The END marker was found before BEGIN marker in the /etc/hosts file.")
-
-        return (file_lines, begin_index, end_index)
+        with open(_HOSTS_PATH, "rb") as f:
+            content = f.read()
+
+        return (content, self._find_redirector_block(content))
 
     def _upsert_redirector_block(self):
         """Update or insert the redirector block in the /etc/hosts file.
@@ -109,35 +192,26 @@ class HostsManager(object):
         """
 
         # Read the /etc/hosts file
-        original_lines, begin_index, end_index = self._read_hosts_file()
+        content, block = self._read_hosts_file()
+        block_content = self._generate_redirector_block_bytes()
 
         # If no marker was found, add the redirector block at the end of the file
-        if begin_index is None and end_index is None:
-
-            final_lines = original_lines.copy()
+        if block is None:
 
             # Add a newline to the last line if it wasn't present
-            last_line = final_lines[len(final_lines) - 1]
-            if not last_line.endswith("\n"):
-                final_lines[len(final_lines) - 1] = f"{last_line}\n"
+            if content and not content.endswith(b"\n"):
+                content += b"\n"
 
-            # Add the redirector block
-            final_lines.extend(self._generate_redirector_block_content())
+            final_content = content + block_content
 
-        # Else, the markers are present, replace the redirector block
+        # Else, the markers are present, replace the redirector block unless it is already up to date
         else:
-
-            # Copy the content before the BEGIN marker
-            final_lines = original_lines[0:begin_index]
-
-            # Replace the redirector block
-            final_lines.extend(self._generate_redirector_block_content())
-
-            # Add the content after the END marker
-            final_lines.extend(original_lines[end_index + 1:len(original_lines)])
+            if content[block.start():block.end()] == block_content:
+                return
+            final_content = content[:block.start()] + block_content + content[block.end():]
 
         # Rewrite the /etc/hosts file
-        self._rewrite_hosts_file(final_lines)
+        self._rewrite_hosts_file(final_content)
 
     def remove_redirector_block(self):
         """Remove the redirector block from the /etc/hosts file.
@@ -147,17 +221,11 @@ class HostsManager(object):
         """
 
         # Read the /etc/hosts file
-        original_lines, begin_index, end_index = self._read_hosts_file()
-
-        # If the markers are present
-        if begin_index is not None and end_index is not None:
-
-            # Remove the block from the lines
-            final_lines = original_lines[0:begin_index]
-            final_lines.extend(original_lines[end_index + 1:len(original_lines)])
+        content, block = self._read_hosts_file()
 
-            # Rewrite the /etc/hosts file
-            self._rewrite_hosts_file(final_lines)
+        # If the markers are present, remove the block and rewrite the /etc/hosts file
+        if block is not None:
+            self._rewrite_hosts_file(content[:block.start()] + content[block.end():])
 
     def load_persisted_entries(self):
         """Load the entries defined in the redirector block in the /etc/hosts file.
@@ -166,22 +234,53 @@ class HostsManager(object):
         :raises: HostsManagerError in case of error
         """
 
-        # Read the /etc/hosts file
-        file_lines, begin_index, end_index = self._read_hosts_file()
+        # Map the /etc/hosts file in memory, only the redirector block is copied out of it
+        # An empty file can't be mapped, and has no redirector block anyway
+        block_lines = None
+        with open(_HOSTS_PATH, "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    block = self._find_redirector_block(content)
+                    if block is not None:
+                        block_lines = block.group(1)
 
         # If the markers are present
-        if begin_index is not None and end_index is not None:
+        if block_lines is not None:
+
+            # Parse the lines between the markers, each one of them must be an entry
+            entries = _ENTRY_RE.findall(block_lines)
+            if len(entries) != block_lines.count(b"\n"):
+                raise HostsManagerError("Failed to parse the redirector block in the /etc/hosts file.")
+
+            # Add the extracted hostnames and IPs to the entries, sharing the repeated strings
+            for ip, hostname in entries:
+                self._entries[sys.intern(hostname.decode())] = sys.intern(ip.decode())
+            self._block = None
+
+    def upsert_entries(self, entries):
+        """Update or insert entries in the /etc/hosts file, rewriting it at most once.
 
-            # Parse each line between the markers
-            for line in file_lines[begin_index + 1:end_index]:
-                res = re.search("^([^ ]+) +(.+)\n$", line)
+        :entries: Iterable of tuples (Canonical hostname, Host to associate to the canonical hostname)
+        :returns: Nothing
+        :raises: HostsManagerError in case of error
+        """
+
+        entries_changed = False
+
+        for local_host, backend_host in entries:
+
+            # Convert the host address to an IP address
+            backend_ip = self._resolve(backend_host)
 
-                # Add the extracted hostname and IP to the entries
-                if res is not None:
-                    ip, hostname = res.groups()
-                    self._entries[hostname] = ip
-                else:
-                    raise HostsManagerError("Failed to parse the redirector block in the /etc/hosts file.")
+            # Update the entry if it didn't exist or changed, sharing the repeated strings
+            if local_host not in self._entries or self._entries[local_host] != backend_ip:
+                self._entries[sys.intern(local_host)] = sys.intern(backend_ip)
+                self._block = None
+                entries_changed = True
+
+        # Update the /etc/hosts file if any entry changed
+        if entries_changed:
+            self._upsert_redirector_block()
 
     def upsert_entry(self, local_host, backend_host):
         """Update or insert an entry in the /etc/hosts file.
@@ -192,29 +291,25 @@ class HostsManager(object):
         :raises: HostsManagerError in case of error
         """
 
-        # Convert the host address to an IP address
-        backend_ip = socket.gethostbyname(backend_host)
-
-        # Update the /etc/hosts file if the entry didn't exist or changed
-        if local_host not in self._entries or self._entries[local_host] != backend_ip:
-            self._entries[local_host] = backend_ip
-            self._upsert_redirector_block()
+        self.upsert_entries([(local_host, backend_host)])
 
     def remove_unexpected_entries(self, expected_hostnames):
         """Remove unexpected entries in the /etc/hosts file.
 
-        :expected_hostnames: List of expected canonical hostnames
+        :expected_hostnames: Set of expected canonical hostnames
         :returns: Nothing
         :raises: HostsManagerError in case of error
         """
 
-        unexpected_hostnames = set(self._entries.keys()).difference(set(expected_hostnames))
-
-        if len(unexpected_hostnames) > 0:
+        # Identify the unexpected entries, leaving the /etc/hosts file untouched if there are none
+        unexpected_hostnames = self._entries.keys() - expected_hostnames
+        if not unexpected_hostnames:
+            return
 
-            # Remove the unexpected entries
-            for hostname in unexpected_hostnames:
-                del self._entries[hostname]
+        # Remove the unexpected entries
+        for hostname in unexpected_hostnames:
+            del self._entries[hostname]
+        self._block = None
 
-            # Update the /etc/hosts file
-            self._upsert_redirector_block()
+        # Update the /etc/hosts file
+        self._upsert_redirector_block()
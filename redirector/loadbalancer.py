@@ -1,27 +1,33 @@
 from redirector.strategies import strategies
-from redirector.healthchecks import healthchecks
+from redirector.healthchecks import create_healthcheck
 from threading import Event, Thread
 
 import logging
 
+_logger = logging.getLogger(__name__)
+
 
 class LoadBalancer(Thread):
 
-    def __init__(self, config, queue):
+    def __init__(self, config, queue, queue_event, healthcheck=None):
         """Constructor of the class.
 
         :config: Configuration of the load balancer
-        :queue: Queue to send new DNS configurations
+        :queue: Deque to send new DNS configurations
+        :queue_event: Event set when a DNS configuration is sent
+        :healthcheck: Healthcheck service to use, created from the configuration if None
         """
 
-        # Initialise the Thread object
-        super().__init__()
+        # Initialise the Thread object, a pending healthcheck mustn't prevent the program from exiting
+        super().__init__(daemon=True)
 
         # Create the strategy object
         self._strategy = strategies[config["strategy"]](config["backend_hosts"])
 
-        # Create the healthcheck service
-        self._healthcheck = healthchecks[config["healthcheck"]["type"]](config["healthcheck"]["config"])
+        # Create the healthcheck service if it isn't shared
+        if healthcheck is None:
+            healthcheck = create_healthcheck(config["healthcheck"])
+        self._healthcheck = healthcheck
 
         # Other instance attributes
         self._lb_name = config["name"]
@@ -29,39 +35,68 @@ class LoadBalancer(Thread):
         self._backend_hosts = config["backend_hosts"]
         self._healthcheck_period = config["healthcheck"]["period"]
         self._queue = queue
+        self._queue_event = queue_event
         self._stop_event = Event()
 
+    def _next_alive_host(self, failed_host):
+        """Check the other backend hosts at once and get the next alive one according to the strategy.
+
+        :failed_host: Backend host whose healthcheck just failed
+        :returns: Tuple (Next host, True if it is alive)
+        """
+
+        # Check all the backend hosts but the one which just failed
+        results = self._healthcheck.check_many([host for host in self._backend_hosts if host != failed_host])
+        alive_hosts = set()
+        for host, (alive, msg) in results.items():
+            if alive:
+                alive_hosts.add(host)
+            else:
+                _logger.debug('Healthcheck for host "%s" on load balancer "%s" failed. Reason: %s.', host, self._lb_name, msg)
+
+        # Choose among the alive hosts, or carry on with the next host if none of them is alive
+        backend_host = self._strategy.next_host_among(alive_hosts)
+        if backend_host is None:
+            return self._strategy.next_host(), False
+
+        return backend_host, True
+
     def run(self):
         """Run the load balancer.
 
         :returns: Nothing
         """
 
+        # Bind the attributes used in the loop to local names
+        is_alive = self._healthcheck.is_alive
+        wait = self._stop_event.wait
+
         timeout = 0
         backend_alive = False
         backend_changed = True
         backend_host = self._strategy.next_host()
 
         # Run while the event flag isn't set and block timeout seconds
-        while not self._stop_event.wait(timeout):
+        while not wait(timeout):
 
             # Check if the backend host responds
-            backend_alive, msg = self._healthcheck.is_alive(backend_host)
+            backend_alive, msg = is_alive(backend_host)
 
-            # If the backend host isn't alive, get the next host
+            # If the backend host isn't alive, check the other hosts at once and switch to the next alive one
             if not backend_alive:
-                logging.debug(f'Healthcheck for host "{backend_host}" on load balancer "{self._lb_name}" failed. Reason: {msg}.')
-                backend_host = self._strategy.next_host()
+                _logger.debug('Healthcheck for host "%s" on load balancer "%s" failed. Reason: %s.', backend_host, self._lb_name, msg)
+                backend_host, backend_alive = self._next_alive_host(backend_host)
                 backend_changed = True
                 timeout = 1
 
             # If the backend is alive and changed
             if backend_changed and backend_alive:
 
-                logging.info(f'Load balancer "{self._lb_name}" now using backend host "{backend_host}".')
+                _logger.info('Load balancer "%s" now using backend host "%s".', self._lb_name, backend_host)
 
                 # Inform the program about the DNS change
-                self._queue.put((self._local_host, backend_host))
+                self._queue.append((self._local_host, backend_host))
+                self._queue_event.set()
 
                 # Reset the backend_changed flag
                 backend_changed = False
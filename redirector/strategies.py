@@ -2,8 +2,12 @@ import random
 
 
 class _BaseStrategy(object):
+
+    __slots__ = ("_hosts", "_next_index", "_len")
+
     def __init__(self, hosts):
         self._hosts = hosts
+        self._len = len(hosts)
 
     def next_host(self):
         """Get the next host according to the strategy.
@@ -13,9 +17,20 @@ class _BaseStrategy(object):
 
         raise NotImplementedError
 
+    def next_host_among(self, alive_hosts):
+        """Get the next host according to the strategy among the given hosts.
+
+        :alive_hosts: Set of hosts which can be chosen
+        :returns: Host, None if none of the hosts can be chosen
+        """
+
+        raise NotImplementedError
+
 
 class SequentialStrategy(_BaseStrategy):
 
+    __slots__ = ()
+
     def __init__(self, hosts):
         super().__init__(hosts)
         self._next_index = 0
@@ -27,19 +42,39 @@ class SequentialStrategy(_BaseStrategy):
         """
 
         # Identify the next host
-        next_host = self._hosts[self._next_index]
+        next_index = self._next_index
+        next_host = self._hosts[next_index]
 
-        # Process the index for the next call
-        self._next_index = (self._next_index + 1) % len(self._hosts)
+        # Process the index for the next call, wrapping around after the last host
+        next_index += 1
+        self._next_index = 0 if next_index == self._len else next_index
 
         return next_host
 
+    def next_host_among(self, alive_hosts):
+        """Get the next host in a sequential fashion among the given hosts.
+
+        :alive_hosts: Set of hosts which can be chosen
+        :returns: Host, None if none of the hosts can be chosen
+        """
+
+        # Skip the hosts which can't be chosen, in order
+        for offset in range(self._len):
+            index = (self._next_index + offset) % self._len
+            if self._hosts[index] in alive_hosts:
+                self._next_index = index
+                return self.next_host()
+
+        return None
+
 
 class RandomStrategy(_BaseStrategy):
 
+    __slots__ = ()
+
     def __init__(self, hosts):
         super().__init__(hosts)
-        self._next_index = random.randint(0, len(self._hosts) - 1)
+        self._next_index = random.randrange(self._len)
 
     def next_host(self):
         """Get the next host in a random fashion.
@@ -50,14 +85,30 @@ class RandomStrategy(_BaseStrategy):
         # Identify the next host
         next_host = self._hosts[self._next_index]
 
-        # Process the index for the next call
-        next_candidate_index = self._next_index
-        while next_candidate_index == self._next_index:
-            next_candidate_index = random.randint(0, len(self._hosts) - 1)
-        self._next_index = next_candidate_index
+        # Process the index for the next call, picking any other host if possible
+        if self._len > 1:
+            next_index = random.randrange(self._len - 1)
+            if next_index >= self._next_index:
+                next_index += 1
+            self._next_index = next_index
 
         return next_host
 
+    def next_host_among(self, alive_hosts):
+        """Get the next host in a random fashion among the given hosts.
+
+        :alive_hosts: Set of hosts which can be chosen
+        :returns: Host, None if none of the hosts can be chosen
+        """
+
+        # Pick any of the hosts which can be chosen
+        indexes = [index for index, host in enumerate(self._hosts) if host in alive_hosts]
+        if not indexes:
+            return None
+        self._next_index = random.choice(indexes)
+
+        return self.next_host()
+
 
 strategies = {
     "sequential": SequentialStrategy,